@@ -1,14 +1,35 @@
 import streamlit as st
 import asyncio
+import bisect
+import concurrent.futures
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+import numpy as np
+import orjson
+from pybloom_live import ScalableBloomFilter
 from solders.pubkey import Pubkey
-from solana.rpc.async_api import AsyncClient
-from solana.rpc.commitment import Confirmed
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+# Debug logging is a no-op in production, keeping formatting and I/O off the hot path
+logger.setLevel(logging.WARNING)
 
 # Fogo testnet configuration
 FOGO_RPC_URL = "https://testnet.fogo.io"
 TESTNET_LAUNCH_DATE = datetime(2025, 7, 22, tzinfo=timezone.utc)
+SIGNATURE_PAGE_LIMIT = 1000  # Max signatures the RPC returns per getSignaturesForAddress call
+MAX_SIGNATURE_PAGES = 5  # Stop walking back through very busy wallets after this many pages
+RPC_TIMEOUT = 10.0  # Seconds
+# Only existence and header fields are needed, so skip the account body entirely
+ACCOUNT_INFO_CONFIG = {"commitment": "confirmed", "encoding": "base64", "dataSlice": {"offset": 0, "length": 0}}
+SLOTS_PER_SECOND = 25  # ~40ms blocks
+SLOTS_PER_DAY = 2_160_000  # ~40ms blocks = 25 blocks/sec * 86400 sec/day
 
 # Updated tiers based on Fogo testnet timeline (launched July 22, 2025)
 # With ~40ms block times, in 6 days we have roughly:
@@ -23,158 +44,368 @@ TIERS = [
     (10_800_000, "🟤 Late (Day 5)"),
     (float("inf"), "🔴 Recently Joined")
 ]
+# Sorted upper bounds (the catch-all tier is implied) and labels for binary search in get_tier
+TIER_THRESHOLDS = [threshold for threshold, _ in TIERS[:-1]]
+TIER_LABELS = [label for _, label in TIERS]
 
-class FogoTestnetChecker:
-    def __init__(self):
-        self.client = AsyncClient(FOGO_RPC_URL)
+# The latest slot only needs ~1s freshness for scoring and is the same for every
+# visitor, so one RPC is shared across all sessions for this many seconds.
+LATEST_SLOT_TTL = 2.0
+# Repeat lookups of the same wallet within this window are served from memory
+RESULT_CACHE_TTL = 60
+RESULT_CACHE_MAX_ENTRIES = 10_000
+# Addresses that came back empty are remembered for this long so repeats skip the RPC
+MISS_FILTER_TTL = 3600
+# Score against a wall-clock estimate of the latest slot instead of asking the RPC for it
+USE_SLOT_ESTIMATE = os.environ.get("FOGO_USE_SLOT_ESTIMATE", "1") != "0"
+CHECK_TIMEOUT = 30  # Seconds a session waits on the background loop before giving up
+
+# Outbound RPC throttle - defaults to 4 requests per 100ms, per process
+FOGO_MAX_RPS = float(os.environ.get("FOGO_MAX_RPS", "40"))
+# Cap on RPCs in flight at once across every session; the bucket above caps sustained rate
+FOGO_MAX_CONCURRENCY = int(os.environ.get("FOGO_MAX_CONCURRENCY", "8"))
+RATE_LIMIT_RETRIES = 5
+# HTTP statuses some endpoints use to refuse JSON-RPC batches outright
+BATCH_REJECTED_STATUSES = {400, 405, 413}
+
+class TokenBucket:
+    """Async token bucket that caps the sustained rate of outbound RPC requests"""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate / 10, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+rpc_bucket = TokenBucket(FOGO_MAX_RPS)
+rpc_semaphore = asyncio.Semaphore(FOGO_MAX_CONCURRENCY)
+
+def throttled(bucket: TokenBucket):
+    """Take a bucket token before each RPC and back off exponentially on HTTP 429"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                await bucket.acquire()
+                try:
+                    return await func(*args, **kwargs)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+                        raise
+                await asyncio.sleep(min(2 ** attempt * 0.1, 2.0) + random.random() * 0.05)
+        return wrapper
+    return decorator
+
+def estimate_latest_slot() -> int:
+    """Estimate the latest slot from the time elapsed since testnet launch"""
+    return int((datetime.now(timezone.utc) - TESTNET_LAUNCH_DATE).total_seconds() * SLOTS_PER_SECOND)
+
+class RpcError(Exception):
+    """Raised when the RPC answers a call with a JSON-RPC error instead of a result"""
+
+class FogoRpc:
+    """Minimal JSON-RPC client returning raw decoded results, without solana-py's model layer"""
+    def __init__(self, url: str):
+        self.url = url
+        # One long-lived HTTP/2 connection multiplexes every in-flight RPC
+        self.http = httpx.AsyncClient(
+            http2=True,
+            timeout=RPC_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=300),
+            # Signature pages are large, highly compressible JSON
+            headers={"Accept-Encoding": "gzip, deflate, br"}
+        )
     
     async def close(self):
-        await self.client.close()
+        await self.http.aclose()
     
-    def is_valid_wallet_address(self, address: str) -> bool:
-        """Validate if the provided string is a valid Solana wallet address"""
+    @throttled(rpc_bucket)
+    async def post(self, payload: Any) -> Any:
+        """POST a JSON-RPC request (or batch) and return the decoded body"""
+        async with rpc_semaphore:
+            response = await self.http.post(
+                self.url,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"}
+            )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    async def call(self, method: str, params: list) -> Any:
+        """Send a single JSON-RPC call and return its result, raising RpcError on an RPC error"""
+        reply = await self.post({"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+        return self.unwrap(method, reply)
+    
+    def unwrap(self, method: str, reply: Optional[Dict[str, Any]]) -> Any:
+        """Return a JSON-RPC reply's result, raising RpcError if it is missing or an error"""
+        if reply is None or "error" in reply:
+            raise RpcError(f"{method} failed: {reply.get('error') if reply else 'no reply'}")
+        return reply.get("result")
+    
+    async def batch(self, calls: List[Tuple[str, list]]) -> List[Any]:
+        """Send several JSON-RPC calls in a single POST and return their results in call order,
+        raising RpcError if any call failed"""
+        payload = [
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+            for request_id, (method, params) in enumerate(calls, start=1)
+        ]
         try:
-            Pubkey.from_string(address)
-            return True
-        except Exception:
-            return False
+            body = await self.post(payload)
+        except httpx.HTTPStatusError as e:
+            # Only fall back when batching itself was refused; resending on 429s or server
+            # errors would just multiply load on an endpoint that is already struggling
+            if e.response.status_code not in BATCH_REJECTED_STATUSES:
+                raise
+            body = None
+        if not isinstance(body, list):
+            # The endpoint rejected the batch, so send the calls individually but concurrently
+            body = await asyncio.gather(*(self.post(call) for call in payload))
+        
+        # Batch replies may arrive in any order, so match them back up by id
+        replies = {reply.get("id"): reply for reply in body}
+        return [
+            self.unwrap(method, replies.get(request_id))
+            for request_id, (method, _) in enumerate(calls, start=1)
+        ]
+
+class FogoTestnetChecker:
+    def __init__(self):
+        self.rpc = FogoRpc(FOGO_RPC_URL)
+        self.reset_miss_filter()
+    
+    def reset_miss_filter(self):
+        """Start a fresh bloom filter of addresses known to have no account"""
+        self.miss_filter = ScalableBloomFilter(mode=ScalableBloomFilter.LARGE_SET_GROWTH)
+        # Addresses later found to exist, checked first so funded wallets and bloom
+        # false positives aren't reported missing once a forced check has seen them
+        self.confirmed_existing = set()
+        self.miss_filter_created = time.monotonic()
+    
+    def is_known_missing(self, address: str) -> bool:
+        """Check whether an address recently came back with no account"""
+        if time.monotonic() - self.miss_filter_created > MISS_FILTER_TTL:
+            self.reset_miss_filter()
+        return address not in self.confirmed_existing and address in self.miss_filter
+    
+    async def close(self):
+        await self.rpc.close()
     
-    async def get_account_info(self, wallet_address: str) -> Optional[Dict[str, Any]]:
-        """Get account information from Fogo testnet"""
+    def parse_wallet_address(self, address: str) -> Optional[Pubkey]:
+        """Parse a Solana wallet address, returning None if it is not valid"""
         try:
-            pubkey = Pubkey.from_string(wallet_address)
-            response = await self.client.get_account_info(pubkey, commitment=Confirmed)
-            return response
+            return Pubkey.from_string(address)
         except Exception:
             return None
     
-    async def get_transaction_history(self, wallet_address: str, limit: int = 1000) -> list:
-        """Get transaction history for the wallet"""
-        try:
-            pubkey = Pubkey.from_string(wallet_address)
-            # Get all transactions, sorted by oldest first
-            response = await self.client.get_signatures_for_address(
-                pubkey, 
-                limit=limit,
-                commitment=Confirmed
-            )
-            if response.value:
-                # Sort by slot number to get the earliest transaction first
-                sorted_txs = sorted(response.value, key=lambda x: x.slot if x.slot else float('inf'))
-                return sorted_txs
-            return []
-        except Exception as e:
-            print(f"Error fetching transaction history: {e}")
-            return []
+    async def get_first_transaction(self, pubkey: Pubkey, limit: int = SIGNATURE_PAGE_LIMIT, before: Optional[str] = None, max_pages: int = MAX_SIGNATURE_PAGES) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Page back through the wallet's signatures and return its earliest transaction,
+        plus whether the walk reached the start of its history within max_pages.
+        RPC failures propagate, so a partial walk is never mistaken for a truncated history."""
+        earliest = None
+        for _ in range(max_pages):
+            options = {"limit": limit, "commitment": "confirmed"}
+            if before:
+                options["before"] = before
+            page = await self.rpc.call("getSignaturesForAddress", [str(pubkey), options])
+            
+            # Signatures come back newest first, so the last one is the earliest on this page
+            if page:
+                earliest = page[-1]
+            if not page or len(page) < limit:
+                return earliest, True
+            before = earliest["signature"]
+        return earliest, False
     
     async def get_latest_slot(self) -> Optional[int]:
         """Get the latest slot number"""
         try:
-            response = await self.client.get_slot(commitment=Confirmed)
-            return response.value if response else None
+            return await self.rpc.call("getSlot", [{"commitment": "confirmed"}])
         except Exception:
             return None
     
     def calculate_score(self, first_slot: int, latest_slot: int) -> float:
         """Calculate early score based on slot numbers - Fogo launched July 22, 2025"""
-        print(f"Debug - First slot: {first_slot}, Latest slot: {latest_slot}")
-        
-        if latest_slot <= first_slot:
-            return 0.0
+        logger.debug("First slot: %s, Latest slot: %s", first_slot, latest_slot)
+        score = float(self.calculate_scores_vec(np.array([first_slot]), latest_slot)[0])
+        logger.debug("Final score: %s", score)
+        return score
+    
+    def calculate_scores_vec(self, first_slots: np.ndarray, latest_slot: int) -> np.ndarray:
+        """Calculate early scores for many wallets at once, e.g. for a leaderboard"""
+        first_slots = np.asarray(first_slots, dtype=np.float64)
         
         # Since testnet is only 6 days old, anyone with transactions should have high scores
-        early_ratio = 1 - (first_slot / latest_slot)
-        base_score = early_ratio * 100
-        
-        print(f"Debug - Early ratio: {early_ratio}, Base score: {base_score}")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base_scores = (1 - first_slots / latest_slot) * 100
         
         # Day-based scoring for super fresh testnet (launched July 22, 2025)
-        days_since_launch = (datetime.now(timezone.utc) - TESTNET_LAUNCH_DATE).days
-        slots_per_day = 2_160_000  # ~40ms blocks = 25 blocks/sec * 86400 sec/day
-        
-        if first_slot < slots_per_day:  # Day 1 users
-            score = min(base_score + 40, 99.9)  # Huge bonus for day 1
-        elif first_slot < slots_per_day * 2:  # Day 2 users
-            score = min(base_score + 30, 95.0)  # Big bonus for day 2
-        elif first_slot < slots_per_day * 3:  # Day 3 users
-            score = min(base_score + 20, 90.0)  # Good bonus for day 3
-        elif first_slot < slots_per_day * 5:  # Day 5 users
-            score = min(base_score + 10, 85.0)  # Small bonus
-        else:
-            score = max(base_score, 50.0)  # Even recent users get decent score since testnet is so new
+        day_buckets = [
+            first_slots < SLOTS_PER_DAY,      # Day 1 users
+            first_slots < SLOTS_PER_DAY * 2,  # Day 2 users
+            first_slots < SLOTS_PER_DAY * 3,  # Day 3 users
+            first_slots < SLOTS_PER_DAY * 5,  # Day 5 users
+        ]
+        bonuses = np.select(day_buckets, [40, 30, 20, 10], default=0)
+        caps = np.select(day_buckets, [99.9, 95.0, 90.0, 85.0], default=np.inf)
+        scores = np.clip(base_scores + bonuses, None, caps)
         
-        print(f"Debug - Final score: {score}")
-        return round(score, 2)
+        # Even recent users get decent score since testnet is so new
+        scores = np.where(day_buckets[-1], scores, np.maximum(base_scores, 50.0))
+        scores = np.where(first_slots >= latest_slot, 0.0, scores)
+        return np.round(scores, 2)
     
     def get_tier(self, slot_num: int) -> str:
         """Get tier based on slot number"""
-        for threshold, label in TIERS:
-            if slot_num < threshold:
-                return label
-        return "🔴 Unknown"
+        return TIER_LABELS[bisect.bisect_right(TIER_THRESHOLDS, slot_num)]
     
-    async def check_wallet(self, wallet_address: str) -> Dict[str, Any]:
-        """Check wallet on Fogo testnet"""
+    async def check_wallet(self, wallet_address: str, latest_slot: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+        """Check wallet on Fogo testnet, optionally using a pre-fetched latest slot.
+        force bypasses the filter of addresses recently seen without an account."""
         result = {
             'valid': False,
             'exists': False,
             'first_slot': None,
             'join_date': None,
             'score': None,
-            'tier': None
+            'tier': None,
+            'history_truncated': False
         }
         
-        # Validate wallet address
-        if not self.is_valid_wallet_address(wallet_address):
+        # Validate wallet address, parsing it once for every call below
+        pubkey = self.parse_wallet_address(wallet_address)
+        if pubkey is None:
             return result
+        address = str(pubkey)
         
         result['valid'] = True
         
+        if not force and self.is_known_missing(address):
+            logger.debug("Skipping known missing address %s", address)
+            return result
+        
+        slot_estimated = latest_slot is None and USE_SLOT_ESTIMATE
+        if slot_estimated:
+            latest_slot = estimate_latest_slot()
+        
+        # Fetch account info, transaction history and (if needed) the latest slot in one round trip
+        calls = [
+            ("getAccountInfo", [address, ACCOUNT_INFO_CONFIG]),
+            ("getSignaturesForAddress", [address, {"limit": SIGNATURE_PAGE_LIMIT, "commitment": "confirmed"}]),
+        ]
+        if latest_slot is None:
+            calls.append(("getSlot", [{"commitment": "confirmed"}]))
+        
+        # Let transport failures propagate so run_async_check doesn't cache them as "not found"
+        replies = await self.rpc.batch(calls)
+        
+        account_info, transactions = replies[0], replies[1]
+        if latest_slot is None:
+            latest_slot = replies[2]
+        
         # Check if account exists
-        account_info = await self.get_account_info(wallet_address)
-        if not account_info or not account_info.value:
+        if not account_info.get("value"):
+            self.miss_filter.add(address)
             return result
         
         result['exists'] = True
+        if address in self.miss_filter:
+            self.confirmed_existing.add(address)
         
-        # Get transaction history and find the FIRST (earliest) transaction
-        transactions = await self.get_transaction_history(wallet_address)
+        # Find the FIRST (earliest) transaction
         if not transactions:
-            print("Debug - No transactions found")
+            logger.debug("No transactions found")
             return result
         
-        print(f"Debug - Found {len(transactions)} transactions")
+        logger.debug("Found %s transactions", len(transactions))
         
-        # Get the first transaction (should be sorted by slot already)
-        first_tx = transactions[0] if transactions else None
-        if not first_tx or not first_tx.slot:
-            print("Debug - No valid first transaction found")
+        # Signatures come back newest first, so the last one is the earliest on this page
+        first_tx = transactions[-1]
+        if len(transactions) == SIGNATURE_PAGE_LIMIT:
+            # Full page - keep walking back from here to reach the wallet's first transaction
+            older, reached_start = await self.get_first_transaction(
+                pubkey,
+                before=first_tx["signature"],
+                max_pages=MAX_SIGNATURE_PAGES - 1
+            )
+            if older:
+                first_tx = older
+            result['history_truncated'] = not reached_start
+        
+        if not first_tx.get("slot"):
+            logger.debug("No valid first transaction found")
             return result
         
-        print(f"Debug - First transaction slot: {first_tx.slot}")
-        result['first_slot'] = first_tx.slot
+        logger.debug("First transaction slot: %s", first_tx['slot'])
+        result['first_slot'] = first_tx['slot']
         
         # Convert slot to date based on July 22, 2025 launch
-        if first_tx.block_time:
-            result['join_date'] = datetime.fromtimestamp(first_tx.block_time, tz=timezone.utc).date()
+        if first_tx.get("blockTime"):
+            result['join_date'] = datetime.fromtimestamp(first_tx['blockTime'], tz=timezone.utc).date()
         else:
             # Estimate based on slot number and 40ms block time from launch date
-            estimated_seconds = (first_tx.slot * 0.04)  # 40ms per block
+            estimated_seconds = (first_tx['slot'] * 0.04)  # 40ms per block
             estimated_date = TESTNET_LAUNCH_DATE + timedelta(seconds=estimated_seconds)
             result['join_date'] = estimated_date.date()
         
         # Calculate score and tier
-        latest_slot = await self.get_latest_slot()
-        print(f"Debug - Latest slot from RPC: {latest_slot}")
+        if slot_estimated and result['first_slot'] >= latest_slot:
+            # The chain has run ahead of the wall-clock estimate, so ask the RPC after all
+            latest_slot = await self.get_latest_slot()
+        logger.debug("Latest slot: %s", latest_slot)
         
         if latest_slot and result['first_slot']:
             result['score'] = self.calculate_score(result['first_slot'], latest_slot)
             result['tier'] = self.get_tier(result['first_slot'])
         else:
-            print("Debug - Could not get latest slot or first slot missing")
+            logger.debug("Could not get latest slot or first slot missing")
         
         return result
 
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Start one event loop on a background thread that lives as long as the app"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_checker() -> FogoTestnetChecker:
+    """Share one checker, and so its pooled TLS connections, across all sessions"""
+    return FogoTestnetChecker()
+
+def run_on_event_loop(coro):
+    """Run a coroutine on the shared background loop and wait for its result"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result(timeout=CHECK_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+@st.cache_data(ttl=LATEST_SLOT_TTL, show_spinner=False)
+def fetch_latest_slot() -> Optional[int]:
+    """Get the latest confirmed slot, shared across Streamlit sessions"""
+    return run_on_event_loop(get_checker().get_latest_slot())
+
+@st.cache_data(ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES, show_spinner=False)
+def run_async_check(wallet_address: str, force: bool = False) -> Dict[str, Any]:
+    """Run the async wallet check from Streamlit's sync script, caching results per wallet"""
+    latest_slot = None if USE_SLOT_ESTIMATE else fetch_latest_slot()
+    # The shared checker's connections belong to the background loop, so always run there
+    return run_on_event_loop(get_checker().check_wallet(wallet_address, latest_slot, force))
+
 # Streamlit App
 st.set_page_config(page_title="Fogo Early Checker", page_icon="🔥", layout="centered")
 
@@ -375,14 +606,9 @@ with st.container():
             spinner_placeholder = st.empty()
             spinner_placeholder.markdown('<div class="loading-spinner"></div>', unsafe_allow_html=True)
             
-            checker = FogoTestnetChecker()
-            
             try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                result = loop.run_until_complete(checker.check_wallet(wallet))
-                loop.run_until_complete(checker.close())
-                loop.close()
+                # ?force=1 re-checks addresses the miss filter would otherwise short-circuit
+                result = run_async_check(wallet, force=st.query_params.get("force") == "1")
             except Exception as e:
                 spinner_placeholder.empty()
                 st.error(f"❌ Error checking wallet: {str(e)}")
@@ -401,6 +627,8 @@ with st.container():
                     st.markdown(f"<div class='info-text'>🏆 Tier: <b>{result['tier']}</b></div>", unsafe_allow_html=True)
                     st.markdown(f"<div class='result-box'>Early Score: {result['score']}%</div>", unsafe_allow_html=True)
                     st.markdown(f"<div style='color:#CC7000; font-weight:600;'>🔥 You're earlier than ~{int(result['score'])}% of wallets!</div>", unsafe_allow_html=True)
+                    if result['history_truncated']:
+                        st.warning(f"⚠️ This wallet has more than {MAX_SIGNATURE_PAGES * SIGNATURE_PAGE_LIMIT:,} transactions, so its true first transaction may be even earlier.")
                 else:
                     st.success("✅ Wallet exists on Fogo testnet")
                     st.info("ℹ️ No transaction history found or unable to calculate score.")